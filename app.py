@@ -1,61 +1,81 @@
-from flask import Flask, render_template, jsonify, request
+from flask import Flask, Response, render_template, jsonify, request
 import numpy as np
 import hashlib
-import json
 import base64
+import functools
+import threading
 from puzzle_generator import PuzzleGenerator
 
 app = Flask(__name__)
 
 generator = PuzzleGenerator(grid_size=4, num_clues=5)
 
+# Largest grid size accepted by the API (solving and shared puzzles)
+MAX_GRID_SIZE = 8
+
+# Most clues accepted in a shared puzzle (the generator emits 5); bounds the size
+# of each cached shared-puzzle response
+MAX_SHARED_CLUES = 16
+
+# One generator (and its reusable Z3 solver) per grid size for the solve endpoint
+_solver_cache = {generator.grid_size: generator}
+_solver_cache_lock = threading.Lock()
+
+
+def get_solver(grid_size):
+    """Return the cached PuzzleGenerator for a grid size, creating it on first use"""
+    with _solver_cache_lock:
+        if grid_size not in _solver_cache:
+            _solver_cache[grid_size] = PuzzleGenerator(grid_size=grid_size)
+        return _solver_cache[grid_size]
+
 
 def hash_solution(grid):
-    """Generate a SHA-256 hash of the grid solution"""
-    # Convert grid to a consistent string representation
-    grid_string = json.dumps(grid.tolist())
-    return hashlib.sha256(grid_string.encode()).hexdigest()
+    """
+    Generate a SHA-256 hash of the grid solution.
+    The hashed bytes are one byte for the grid size followed by the cell bits packed
+    little-endian in row-major order, the same layout as the solution in
+    serialize_puzzle (no intermediate list, JSON or text encoding).
+    """
+    solution_bytes = np.packbits(grid.ravel(), bitorder='little').tobytes()
+    return hash_solution_bytes(grid.shape[0], solution_bytes)
+
+
+def hash_solution_bytes(grid_size, solution_bytes):
+    """Generate a SHA-256 hash of a solution already packed as in serialize_puzzle"""
+    # Hash the grid size followed by the packed little-endian solution bits
+    return hashlib.sha256(bytes([grid_size]) + solution_bytes).hexdigest()
 
 
 def serialize_puzzle(key, clues):
     """
     Serialize a puzzle (solution + clues) into a URL-safe base64 string.
     Format: [grid_size][solution_bits][num_clues][clue1_bits][clue2_bits]...
+    Returns (puzzle_string, solution_bytes) so the packed solution can be hashed
+    without packing it again.
     """
     grid_size = key.shape[0]
     total_cells = grid_size * grid_size
 
-    # Convert grids to integers
-    def grid_to_int(grid):
-        bits = grid.flatten()
-        value = 0
-        for i, bit in enumerate(bits):
-            value |= (int(bit) << i)
-        return value
-
-    # Build byte array
-    bytes_array = bytearray()
-
-    # Grid size (1 byte)
-    bytes_array.append(grid_size)
-
-    # Solution (convert to bytes, little-endian)
-    solution_int = grid_to_int(key)
     num_bytes = (total_cells + 7) // 8  # Round up to nearest byte
-    solution_bytes = solution_int.to_bytes(num_bytes, byteorder='little')
-    bytes_array.extend(solution_bytes)
 
-    # Number of clues (1 byte)
-    bytes_array.append(len(clues))
+    # Solution (packed bits, little-endian)
+    solution_bytes = np.packbits(key.ravel(), bitorder='little').tobytes()[:num_bytes]
+
+    # Each clue, packed in a single pass (one row of bytes per clue)
+    clue_rows = np.packbits(np.stack([clue.ravel() for clue in clues]), axis=1, bitorder='little')
 
-    # Each clue
-    for clue in clues:
-        clue_int = grid_to_int(clue)
-        clue_bytes = clue_int.to_bytes(num_bytes, byteorder='little')
-        bytes_array.extend(clue_bytes)
+    # Grid size (1 byte), solution, number of clues (1 byte), clues
+    puzzle_bytes = b''.join((
+        bytes([grid_size]),
+        solution_bytes,
+        bytes([len(clues)]),
+        clue_rows[:, :num_bytes].tobytes(),
+    ))
 
-    # Convert to URL-safe base64
-    return base64.urlsafe_b64encode(bytes_array).decode('ascii').rstrip('=')
+    # Convert to URL-safe base64, dropping the '=' padding
+    unpadded_length = (4 * len(puzzle_bytes) + 2) // 3
+    return base64.urlsafe_b64encode(puzzle_bytes)[:unpadded_length].decode('ascii'), solution_bytes
 
 
 def deserialize_puzzle(puzzle_string):
@@ -66,36 +86,45 @@ def deserialize_puzzle(puzzle_string):
     try:
         # Add padding if needed
         padding = (4 - len(puzzle_string) % 4) % 4
-        puzzle_string += '=' * padding
 
         # Decode from base64
-        bytes_array = base64.urlsafe_b64decode(puzzle_string)
+        bytes_array = base64.urlsafe_b64decode(puzzle_string + '=' * padding)
+
+        # Only accept the canonical unpadded URL-safe encoding, so each puzzle has
+        # a single string form (and a single cache entry)
+        if base64.urlsafe_b64encode(bytes_array).decode('ascii').rstrip('=') != puzzle_string:
+            raise ValueError("puzzle string is not in canonical form")
 
         # Parse grid size
         grid_size = bytes_array[0]
+        if not 1 <= grid_size <= MAX_GRID_SIZE:
+            raise ValueError(f"grid size {grid_size} out of range")
         total_cells = grid_size * grid_size
         num_bytes = (total_cells + 7) // 8
 
-        # Helper to convert bytes to grid
-        def int_to_grid(value, grid_size):
-            bits = [(value >> i) & 1 for i in range(grid_size * grid_size)]
-            return np.array(bits, dtype=np.uint8).reshape(grid_size, grid_size)
+        # The payload must hold exactly the solution and the number of clues it declares
+        num_clues = bytes_array[1+num_bytes]
+        if num_clues > MAX_SHARED_CLUES:
+            raise ValueError(f"too many clues ({num_clues})")
+        if len(bytes_array) != 2 + (1 + num_clues) * num_bytes:
+            raise ValueError(f"expected {2 + (1 + num_clues) * num_bytes} bytes, got {len(bytes_array)}")
+
+        # Helper to convert packed little-endian bytes to grid
+        def bytes_to_grid(grid_bytes):
+            bits = np.unpackbits(np.frombuffer(grid_bytes, dtype=np.uint8),
+                                 count=total_cells, bitorder='little')
+            return bits.reshape(grid_size, grid_size)
 
         # Parse solution
         solution_bytes = bytes_array[1:1+num_bytes]
-        solution_int = int.from_bytes(solution_bytes, byteorder='little')
-        key = int_to_grid(solution_int, grid_size)
-
-        # Parse number of clues
-        num_clues = bytes_array[1+num_bytes]
+        key = bytes_to_grid(solution_bytes)
 
         # Parse clues
         clues = []
         offset = 2 + num_bytes
         for i in range(num_clues):
             clue_bytes = bytes_array[offset:offset+num_bytes]
-            clue_int = int.from_bytes(clue_bytes, byteorder='little')
-            clue = int_to_grid(clue_int, grid_size)
+            clue = bytes_to_grid(clue_bytes)
             clues.append(clue)
             offset += num_bytes
 
@@ -105,6 +134,31 @@ def deserialize_puzzle(puzzle_string):
         return None
 
 
+@functools.lru_cache(maxsize=4096)
+def render_shared_puzzle(puzzle_param):
+    """
+    Render the JSON response body for a shared puzzle.
+    Returns the body as bytes, or None if the puzzle data is invalid.
+    """
+    # Deserialize the shared puzzle
+    result = deserialize_puzzle(puzzle_param)
+    if not result:
+        return None
+
+    key, clues = result
+    # Calculate counts from the key and clues (all clues in one AND + sum)
+    counts = (np.stack(clues) & key).reshape(len(clues), -1).sum(axis=1).tolist() if clues else []
+
+    return app.json.dumps({
+        'success': True,
+        'clues': [clue.tolist() for clue in clues],
+        'counts': counts,
+        'gridSize': key.shape[0],
+        'solutionHash': hash_solution(key),
+        'puzzleData': puzzle_param  # Send back the puzzle data for sharing
+    }, separators=(',', ':')).encode('utf-8')
+
+
 @app.route('/')
 def index():
     """Render the main game page"""
@@ -118,21 +172,10 @@ def new_puzzle():
     puzzle_param = request.args.get('puzzle')
 
     if puzzle_param:
-        # Deserialize the shared puzzle
-        result = deserialize_puzzle(puzzle_param)
-        if result:
-            key, clues = result
-            # Calculate counts from the key and clues
-            counts = [int(np.sum(key & clue)) for clue in clues]
-
-            return jsonify({
-                'success': True,
-                'clues': [clue.tolist() for clue in clues],
-                'counts': counts,
-                'gridSize': key.shape[0],
-                'solutionHash': hash_solution(key),
-                'puzzleData': puzzle_param  # Send back the puzzle data for sharing
-            })
+        # Shared puzzles are deterministic, so the rendered response is cached
+        body = render_shared_puzzle(puzzle_param)
+        if body is not None:
+            return Response(body, mimetype='application/json')
         else:
             return jsonify({
                 'success': False,
@@ -146,7 +189,7 @@ def new_puzzle():
         key, clues, counts, attempts = result
 
         # Serialize the puzzle for sharing
-        puzzle_data = serialize_puzzle(key, clues)
+        puzzle_data, solution_bytes = serialize_puzzle(key, clues)
 
         # Return clues, counts, and hashed solution to frontend
         return jsonify({
@@ -154,7 +197,7 @@ def new_puzzle():
             'clues': [clue.tolist() for clue in clues],
             'counts': counts,
             'gridSize': generator.grid_size,
-            'solutionHash': hash_solution(key),
+            'solutionHash': hash_solution_bytes(generator.grid_size, solution_bytes),
             'puzzleData': puzzle_data  # Include serialized puzzle for sharing
         })
     else:
@@ -173,8 +216,14 @@ def solve_puzzle():
         counts = data['counts']
         grid_size = data.get('gridSize', 4)
 
-        # Create a generator with the appropriate grid size
-        solver = PuzzleGenerator(grid_size=grid_size)
+        if not isinstance(grid_size, int) or not 1 <= grid_size <= MAX_GRID_SIZE:
+            return jsonify({
+                'success': False,
+                'error': f'gridSize must be an integer between 1 and {MAX_GRID_SIZE}'
+            }), 400
+
+        # Reuse the cached generator for this grid size
+        solver = get_solver(grid_size)
 
         # Solve the puzzle
         solution = solver.solve_puzzle(clues, counts)
@@ -1,201 +1,252 @@
 import numpy as np
-import random
+import threading
 from typing import List, Tuple, Optional
 from z3 import *
 
+# Grids up to this many cells are checked by enumerating every candidate grid
+# with NumPy; larger grids fall back to Z3
+MAX_ENUM_CELLS = 20
+
+# Number of attempts generated and filtered at once by generate_puzzle
+CLUE_BATCH_SIZE = 256
+
+# NumPy >= 2.0 provides a native (SIMD) popcount ufunc
+HAS_BITWISE_COUNT = hasattr(np, 'bitwise_count')
+
+# Number of set bits in each 16-bit value (fallback when np.bitwise_count is missing)
+if not HAS_BITWISE_COUNT:
+    POP16 = np.unpackbits(np.arange(1 << 16, dtype=np.uint16).view(np.uint8)).reshape(-1, 16).sum(axis=1).astype(np.uint8)
+
+
+def popcount(values: np.ndarray) -> np.ndarray:
+    """
+    Count the set bits of each element of an unsigned integer array (16 bits or wider),
+    or of an object array of Python ints (grids over 64 cells, see pack_grids)
+    """
+    if values.dtype == object:
+        return np.frompyfunc(int.bit_count, 1, 1)(values).astype(np.int64)
+    if HAS_BITWISE_COUNT:
+        return np.bitwise_count(values)
+    # One table gather per 16-bit chunk of each value
+    chunk_counts = POP16[values.view(np.uint16)]
+    return chunk_counts.reshape(*values.shape, values.itemsize // 2).sum(axis=-1)
+
+
+def pack_grids(grids: np.ndarray) -> np.ndarray:
+    """
+    Pack binary grids of shape (..., grid_size, grid_size) into bitmasks
+    (bit i = cell i in row-major order). Grids of up to 64 cells give uint64
+    masks; larger grids give an object array of Python ints.
+    """
+    flat = grids.reshape(*grids.shape[:-2], -1)
+    packed = np.packbits(flat, axis=-1, bitorder='little')
+    if flat.shape[-1] > 64:
+        masks = np.empty(packed.shape[:-1], dtype=object)
+        for index in np.ndindex(masks.shape):
+            masks[index] = int.from_bytes(packed[index].tobytes(), byteorder='little')
+        return masks
+    padded = np.zeros((*packed.shape[:-1], 8), dtype=np.uint8)
+    padded[..., :packed.shape[-1]] = packed
+    return padded.view('<u8')[..., 0]
+
 
 class PuzzleGenerator:
-    """Generate binary grid logic puzzles with unique solutions using Z3 SAT solver"""
+    """Generate binary grid logic puzzles with unique solutions using NumPy enumeration or Z3 SAT solver"""
 
     def __init__(self, grid_size=4, num_clues=5):
         self.grid_size = grid_size
         self.num_clues = num_clues
         self.total_cells = grid_size * grid_size
 
+        # Every candidate grid as an integer bitmask (bit i = cell i in row-major order)
+        if self.total_cells <= MAX_ENUM_CELLS:
+            self.all_grids = np.arange(1 << self.total_cells, dtype=np.uint32)
+        else:
+            self.all_grids = None
+
+        # Reusable Z3 solver; per-check constraints live in a push/pop scope
+        self._grid_vars = [[Bool(f"cell_{i}_{j}") for j in range(self.grid_size)]
+                           for i in range(self.grid_size)]
+        self._solver = Solver()
+        self._solver_lock = threading.Lock()
+
+        # Per-instance RNG so generators never contend on the global NumPy random state
+        self._rng = np.random.default_rng()
+
     def generate_key(self) -> np.ndarray:
         """Generate a random binary grid"""
-        return np.random.randint(0, 2, (self.grid_size, self.grid_size), dtype=np.uint8)
+        return self._rng.integers(0, 2, (self.grid_size, self.grid_size), dtype=np.uint8)
 
     def generate_strategic_clues(self) -> List[np.ndarray]:
         """Generate clues with diverse patterns for better uniqueness"""
-        clues = []
-
-        # Strategy 1: Sparse clue
-        clue = np.zeros((self.grid_size, self.grid_size), dtype=np.uint8)
-        positions = random.sample(range(self.total_cells), k=random.randint(4, 8))
-        for pos in positions:
-            clue[pos // self.grid_size, pos % self.grid_size] = 1
-        clues.append(clue)
-
-        # Strategy 2: Dense clue
-        clue = np.ones((self.grid_size, self.grid_size), dtype=np.uint8)
-        positions = random.sample(range(self.total_cells), k=random.randint(4, 8))
-        for pos in positions:
-            clue[pos // self.grid_size, pos % self.grid_size] = 0
-        clues.append(clue)
+        return list(self.generate_clue_batch(1)[0])
+
+    def generate_clue_batch(self, batch_size: int) -> np.ndarray:
+        """
+        Generate strategic clues for several attempts at once.
+        Returns an array of shape (batch_size, num_clues, grid_size, grid_size).
+        """
+        shape = (batch_size, self.total_cells)
+
+        # Strategy 1: Sparse clue (4-8 random cells set)
+        # Ranking random values gives a random permutation of cell positions per row
+        ranks = self._rng.random(shape, dtype=np.float32).argsort(axis=1).argsort(axis=1)
+        sparse = ranks < self._rng.integers(4, 9, size=(batch_size, 1))
+
+        # Strategy 2: Dense clue (4-8 random cells cleared)
+        ranks = self._rng.random(shape, dtype=np.float32).argsort(axis=1).argsort(axis=1)
+        dense = ranks >= self._rng.integers(4, 9, size=(batch_size, 1))
 
         # Strategy 3-5: Random clues with varying density
-        for _ in range(self.num_clues - 2):
-            density = random.uniform(0.3, 0.7)
-            clue = (np.random.random((self.grid_size, self.grid_size)) < density) * np.uint8(1)
-            clues.append(clue)
+        num_random = max(self.num_clues - 2, 0)
+        densities = self._rng.uniform(0.3, 0.7, size=(batch_size, num_random, 1)).astype(np.float32)
+        random_clues = self._rng.random((batch_size, num_random, self.total_cells), dtype=np.float32) < densities
 
-        return clues
+        clues = np.concatenate([sparse[:, None], dense[:, None], random_clues], axis=1).astype(np.uint8)
+        return clues.reshape(batch_size, -1, self.grid_size, self.grid_size)
 
     def apply_clue(self, key: np.ndarray, clue: np.ndarray) -> int:
         """Apply clue to key (element-wise AND) and count 1's"""
-        return int(np.sum(key & clue))
+        return (self.grid_to_int(key) & self.grid_to_int(clue)).bit_count()
 
     def grid_to_int(self, grid: np.ndarray) -> int:
         """Convert grid to integer for efficient representation"""
-        return int(np.sum(grid.flatten() * (2 ** np.arange(self.total_cells))))
+        return int.from_bytes(np.packbits(grid.ravel(), bitorder='little').tobytes(), byteorder='little')
 
     def int_to_grid(self, value: int) -> np.ndarray:
         """Convert integer back to grid"""
-        bits = [(value >> i) & 1 for i in range(self.total_cells)]
-        return np.array(bits, dtype=np.uint8).reshape(self.grid_size, self.grid_size)
+        value_bytes = np.frombuffer(value.to_bytes((self.total_cells + 7) // 8, byteorder='little'), dtype=np.uint8)
+        bits = np.unpackbits(value_bytes, count=self.total_cells, bitorder='little')
+        return bits.reshape(self.grid_size, self.grid_size)
+
+    def _clue_constraint(self, clue: np.ndarray, target_count: int):
+        """Z3 constraint: the grid has exactly target_count 1's among the clue's cells"""
+        # Count cells where both grid_var and clue are 1
+        selected = [
+            (self._grid_vars[i][j], 1)
+            for i in range(self.grid_size)
+            for j in range(self.grid_size)
+            if clue[i][j] == 1
+        ]
+        if not selected:
+            # PbEq needs at least one term; an empty clue only matches a count of 0
+            return BoolVal(int(target_count) == 0)
+        return PbEq(selected, int(target_count))
 
     def solve_puzzle(self, clues: List[np.ndarray], counts: List[int]) -> Optional[np.ndarray]:
         """
         Solve a puzzle using Z3 SAT solver.
         Returns the solution grid or None if no solution exists.
         """
-        # Create boolean variables for each cell
-        grid_vars = [[Bool(f"cell_{i}_{j}") for j in range(self.grid_size)] 
-                     for i in range(self.grid_size)]
-        
-        solver = Solver()
-        
-        # Add constraints for each clue
-        for clue, target_count in zip(clues, counts):
-            # Count cells where both grid_var and clue are 1
-            constraint_sum = Sum([
-                If(grid_vars[i][j], 1, 0)
-                for i in range(self.grid_size)
-                for j in range(self.grid_size)
-                if clue[i][j] == 1
-            ])
-            solver.add(constraint_sum == target_count)
-        
-        # Check if solution exists
-        if solver.check() == sat:
-            model = solver.model()
-            solution = np.zeros((self.grid_size, self.grid_size), dtype=np.uint8)
-            for i in range(self.grid_size):
-                for j in range(self.grid_size):
-                    if is_true(model[grid_vars[i][j]]):
-                        solution[i][j] = 1
-            return solution
-        
-        return None
+        grid_vars = self._grid_vars
+        solver = self._solver
+
+        with self._solver_lock:
+            solver.push()
+            try:
+                # Add constraints for each clue
+                for clue, target_count in zip(clues, counts):
+                    solver.add(self._clue_constraint(clue, target_count))
+
+                # Check if solution exists
+                if solver.check() == sat:
+                    model = solver.model()
+                    solution = np.zeros((self.grid_size, self.grid_size), dtype=np.uint8)
+                    for i in range(self.grid_size):
+                        for j in range(self.grid_size):
+                            if is_true(model[grid_vars[i][j]]):
+                                solution[i][j] = 1
+                    return solution
+
+                return None
+            finally:
+                solver.pop()
+
+    def _matching_grids(self, clue_masks: List[int], counts: List[int]) -> np.ndarray:
+        """
+        Filter all candidate grids by each clue bitmask in turn (AND + popcount).
+        Returns the grids (as bitmasks) that satisfy all clues.
+        """
+        grids = self.all_grids
+        if grids is None:
+            grids = np.arange(1 << self.total_cells, dtype=np.uint32)
+
+        # Compact after each clue so later clues only test the remaining candidates
+        for clue_mask, target_count in zip(clue_masks, counts):
+            grids = grids[popcount(grids & np.uint32(clue_mask)) == target_count]
+            if grids.size == 0:
+                break
+        return grids
 
     def check_uniqueness_fast(self, clues: List[np.ndarray], counts: List[int]) -> Tuple[bool, int]:
         """
-        Check if there's exactly one solution using Z3 SAT solver.
+        Check if there's exactly one solution.
         Returns (is_unique, num_solutions)
-        
-        This is MUCH faster than brute force, especially for larger grids
-        """
-        # Create boolean variables for each cell
-        grid_vars = [[Bool(f"cell_{i}_{j}") for j in range(self.grid_size)] 
-                     for i in range(self.grid_size)]
-        
-        solver = Solver()
-        
-        # Add constraints for each clue
-        for clue, target_count in zip(clues, counts):
-            # Count cells where both grid_var and clue are 1
-            constraint_sum = Sum([
-                If(grid_vars[i][j], 1, 0)
-                for i in range(self.grid_size)
-                for j in range(self.grid_size)
-                if clue[i][j] == 1
-            ])
-            solver.add(constraint_sum == target_count)
-        
-        # Check for first solution
-        if solver.check() != sat:
-            return False, 0
-        
-        # Get first solution
-        model1 = solver.model()
-        
-        # Create constraint that excludes this solution
-        exclusion = Or([
-            grid_vars[i][j] != model1[grid_vars[i][j]]
-            for i in range(self.grid_size)
-            for j in range(self.grid_size)
-        ])
-        solver.add(exclusion)
-        
-        # Check for second solution
-        if solver.check() == sat:
-            return False, 2  # At least 2 solutions exist
-        else:
-            return True, 1  # Exactly 1 solution
 
-    # Keep old brute-force methods as backup for comparison/testing
+        Small grids are checked by enumerating every candidate grid with NumPy,
+        larger grids use the Z3 SAT solver. num_solutions is capped at 2.
+        """
+        if self.all_grids is not None:
+            matches = self._matching_grids([self.grid_to_int(clue) for clue in clues], counts)
+            num_solutions = min(matches.size, 2)
+            return num_solutions == 1, num_solutions
+
+        grid_vars = self._grid_vars
+        solver = self._solver
+
+        with self._solver_lock:
+            solver.push()
+            try:
+                # Add constraints for each clue
+                for clue, target_count in zip(clues, counts):
+                    solver.add(self._clue_constraint(clue, target_count))
+
+                # Check for first solution
+                if solver.check() != sat:
+                    return False, 0
+
+                # Get first solution
+                model1 = solver.model()
+
+                # Create constraint that excludes this solution
+                exclusion = Or([
+                    grid_vars[i][j] != model1[grid_vars[i][j]]
+                    for i in range(self.grid_size)
+                    for j in range(self.grid_size)
+                ])
+                solver.add(exclusion)
+
+                # Check for second solution
+                if solver.check() == sat:
+                    return False, 2  # At least 2 solutions exist
+                else:
+                    return True, 1  # Exactly 1 solution
+            finally:
+                solver.pop()
+
+    # Brute-force methods enumerate every grid; useful for comparison/testing
     def solve_puzzle_brute_force(self, clues: List[np.ndarray], counts: List[int]) -> Optional[np.ndarray]:
         """
         Solve a puzzle by finding the first grid that satisfies all clues.
-        Uses brute-force search over all 2^(grid_size^2) possible grids.
+        Uses a vectorized search over all 2^(grid_size^2) possible grids.
         Returns the solution grid or None if no solution exists.
-        
-        NOTE: Use solve_puzzle() instead - it uses Z3 and is much faster.
+
+        NOTE: Only practical for small grids - use solve_puzzle() for larger ones.
         """
-        # Pre-flatten clues for faster computation
-        flat_clues = [clue.flatten() for clue in clues]
-        max_value = 2 ** self.total_cells
-
-        # Check all possible grids
-        for i in range(max_value):
-            # Convert to binary array efficiently
-            grid = np.array([(i >> j) & 1 for j in range(self.total_cells)], dtype=np.uint8)
-
-            # Check if this grid satisfies all clues
-            satisfies_all = True
-            for flat_clue, target_count in zip(flat_clues, counts):
-                if np.sum(grid & flat_clue) != target_count:
-                    satisfies_all = False
-                    break
-
-            if satisfies_all:
-                # Return the first solution found (reshaped to grid)
-                return grid.reshape(self.grid_size, self.grid_size)
-
-        # No solution found
-        return None
+        matches = self._matching_grids([self.grid_to_int(clue) for clue in clues], counts)
+        if matches.size == 0:
+            return None
+        return self.int_to_grid(int(matches[0]))
 
     def check_uniqueness_brute_force(self, clues: List[np.ndarray], counts: List[int]) -> Tuple[bool, int]:
         """
         Efficiently check if there's exactly one solution using brute force.
         Returns (is_unique, num_solutions)
-        
-        NOTE: Use check_uniqueness_fast() instead - it uses Z3 and is much faster.
-        """
-        # Pre-flatten clues for faster computation
-        flat_clues = [clue.flatten() for clue in clues]
-
-        solution_count = 0
-        max_value = 2 ** self.total_cells
-
-        # Check all possible grids
-        for i in range(max_value):
-            # Convert to binary array efficiently
-            grid = np.array([(i >> j) & 1 for j in range(self.total_cells)], dtype=np.uint8)
-
-            # Check if this grid satisfies all clues
-            satisfies_all = True
-            for flat_clue, target_count in zip(flat_clues, counts):
-                if np.sum(grid & flat_clue) != target_count:
-                    satisfies_all = False
-                    break
-
-            if satisfies_all:
-                solution_count += 1
-                if solution_count > 1:
-                    return False, solution_count
 
+        NOTE: Only practical for small grids - use check_uniqueness_fast() instead.
+        """
+        matches = self._matching_grids([self.grid_to_int(clue) for clue in clues], counts)
+        solution_count = min(matches.size, 2)
         return solution_count == 1, solution_count
 
     def generate_puzzle(self, max_attempts=10000, verbose=True) -> Optional[Tuple]:
@@ -205,44 +256,56 @@ class PuzzleGenerator:
         """
         if verbose:
             print(f"Generating puzzle (grid: {self.grid_size}x{self.grid_size}, clues: {self.num_clues})...")
-            print("Using Z3 SAT solver for uniqueness checking")
+            if self.all_grids is not None:
+                print("Using vectorized enumeration for uniqueness checking")
+            else:
+                print("Using Z3 SAT solver for uniqueness checking")
+
+        full_mask = pack_grids(np.ones((self.grid_size, self.grid_size), dtype=np.uint8))
+
+        for batch_start in range(0, max_attempts, CLUE_BATCH_SIZE):
+            batch_size = min(CLUE_BATCH_SIZE, max_attempts - batch_start)
 
-        for attempt in range(1, max_attempts + 1):
-            # Generate key
-            key = self.generate_key()
+            # Generate keys and strategic clues for a whole batch of attempts
+            keys = self._rng.integers(0, 2, (batch_size, self.grid_size, self.grid_size), dtype=np.uint8)
+            clue_batch = self.generate_clue_batch(batch_size)
 
-            # Generate strategic clues
-            clues = self.generate_strategic_clues()
+            # Pack to bitmasks so every filter is an AND + popcount over the batch
+            key_masks = pack_grids(keys)
+            clue_masks = pack_grids(clue_batch)
+            clue_pops = popcount(clue_masks)  # Number of 1's in each clue, computed once per batch
+            counts = popcount(key_masks[:, None] & clue_masks)
 
             # Ensure every cell is covered by at least one clue (necessary for uniqueness)
             # If any cell isn't in any clue, that cell is ambiguous
-            coverage = np.zeros((self.grid_size, self.grid_size), dtype=np.uint8)
-            for clue in clues:
-                coverage |= clue
-            if np.sum(coverage) < self.total_cells:
-                # Some cells aren't covered by any clue, skip this attempt
-                continue
-
-            counts = [self.apply_clue(key, clue) for clue in clues]
+            ok = np.bitwise_or.reduce(clue_masks, axis=1) == full_mask
 
             # Skip if any clue has a count of 0 (makes puzzle too easy)
-            if any(count == 0 for count in counts):
-                continue
-            
+            ok &= (counts > 0).all(axis=1)
+
             # Skip if any clue's count equals its total number of 1s (makes puzzle too easy)
-            if any(count == np.sum(clue) for count, clue in zip(counts, clues)):
-                continue
+            ok &= (counts < clue_pops).all(axis=1)
+
+            # Only the surviving attempts reach the uniqueness check
+            for index in np.flatnonzero(ok):
+                attempt = batch_start + int(index) + 1
+                attempt_counts = counts[index].tolist()
 
-            # Check uniqueness using Z3
-            is_unique, num_solutions = self.check_uniqueness_fast(clues, counts)
+                if self.all_grids is not None:
+                    # Enumerable grids (e.g. 4x4): check straight from the packed masks
+                    matches = self._matching_grids(clue_masks[index].tolist(), attempt_counts)
+                    num_solutions = min(matches.size, 2)
+                    is_unique = num_solutions == 1
+                else:
+                    is_unique, num_solutions = self.check_uniqueness_fast(list(clue_batch[index]), attempt_counts)
 
-            if verbose and attempt % 10 == 0:
-                print(f"  Attempt {attempt}: Found {num_solutions} solution(s)...")
+                if verbose and attempt % 10 == 0:
+                    print(f"  Attempt {attempt}: Found {num_solutions} solution(s)...")
 
-            if is_unique:
-                if verbose:
-                    print(f"✓ Puzzle generated successfully in {attempt} attempts!\n")
-                return key, clues, counts, attempt
+                if is_unique:
+                    if verbose:
+                        print(f"✓ Puzzle generated successfully in {attempt} attempts!\n")
+                    return keys[index], list(clue_batch[index]), attempt_counts, attempt
 
         if verbose:
             print(f"✗ Failed to generate puzzle with unique solution after {max_attempts} attempts")
@@ -272,8 +335,9 @@ class PuzzleGenerator:
 
     def verify_solution(self, key: np.ndarray, clues: List[np.ndarray], counts: List[int]) -> bool:
         """Verify that a key satisfies all clues"""
+        key_mask = self.grid_to_int(key)
         for clue, target_count in zip(clues, counts):
-            if self.apply_clue(key, clue) != target_count:
+            if (key_mask & self.grid_to_int(clue)).bit_count() != target_count:
                 return False
         return True
 
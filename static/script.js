@@ -5,10 +5,14 @@ let currentPuzzle = {
     gridSize: 4,
     userGrid: [],
     solutionHash: null,
+    hashVersion: null,  // Format version of solutionHash
     isCorrect: false,
     puzzleData: null  // For sharing
 };
 
+// Version of the solution hash format (bumped when the backend's hash input changes)
+const HASH_VERSION = 2;
+
 // Initialize the game
 document.addEventListener('DOMContentLoaded', () => {
     initializeEventListeners();
@@ -115,6 +119,7 @@ function savePuzzleState() {
         gridSize: currentPuzzle.gridSize,
         userGrid: currentPuzzle.userGrid,
         solutionHash: currentPuzzle.solutionHash,
+        hashVersion: currentPuzzle.hashVersion,
         isCorrect: currentPuzzle.isCorrect,
         puzzleData: currentPuzzle.puzzleData
     };
@@ -136,9 +141,18 @@ function loadPuzzleState() {
             currentPuzzle.gridSize = puzzleState.gridSize;
             currentPuzzle.userGrid = puzzleState.userGrid;
             currentPuzzle.solutionHash = puzzleState.solutionHash;
+            currentPuzzle.hashVersion = puzzleState.hashVersion;
             currentPuzzle.isCorrect = puzzleState.isCorrect;
             currentPuzzle.puzzleData = puzzleState.puzzleData;
 
+            // Hashes saved in an older format can never match; fetch a fresh one
+            if (currentPuzzle.hashVersion !== HASH_VERSION) {
+                if (!puzzleState.puzzleData) {
+                    return false;
+                }
+                refreshSolutionHash();
+            }
+
             return true;
         } catch (error) {
             console.error('error loading puzzle state from local storage:', error);
@@ -149,6 +163,22 @@ function loadPuzzleState() {
     return false;
 }
 
+async function refreshSolutionHash() {
+    // Re-fetch the current puzzle's solution hash, keeping the user's progress
+    try {
+        const response = await fetch(`/api/new-puzzle?puzzle=${encodeURIComponent(currentPuzzle.puzzleData)}`);
+        const data = await response.json();
+
+        if (data.success) {
+            currentPuzzle.solutionHash = data.solutionHash;
+            currentPuzzle.hashVersion = HASH_VERSION;
+            savePuzzleState();
+        }
+    } catch (error) {
+        console.error('error refreshing solution hash:', error);
+    }
+}
+
 function clearPuzzleState() {
     // Remove puzzle state from local storage
     localStorage.removeItem('currentPuzzle');
@@ -213,6 +243,7 @@ async function generateNewPuzzle(puzzleParam = null, clearUrl = false) {
             currentPuzzle.counts = data.counts;
             currentPuzzle.gridSize = data.gridSize;
             currentPuzzle.solutionHash = data.solutionHash;
+            currentPuzzle.hashVersion = HASH_VERSION;
             currentPuzzle.isCorrect = false;
             currentPuzzle.puzzleData = data.puzzleData;  // Store puzzle data for sharing
 
@@ -446,11 +477,16 @@ function renderClues() {
 }
 
 async function hashGrid(grid) {
-    // Convert grid to the same JSON string format as the backend
-    // Python's json.dumps() adds spaces after commas and colons, so we need to match that
-    const gridString = JSON.stringify(grid, null, 0).replace(/,/g, ', ').replace(/:/g, ': ');
-    const encoder = new TextEncoder();
-    const data = encoder.encode(gridString);
+    // Convert grid to the same byte format as the backend: the grid size
+    // followed by the cells packed as little-endian bits in row-major order
+    const cells = grid.flat();
+    const data = new Uint8Array(1 + Math.ceil(cells.length / 8));
+    data[0] = grid.length;
+    cells.forEach((bit, i) => {
+        if (bit === 1) {
+            data[1 + (i >> 3)] |= 1 << (i & 7);
+        }
+    });
     const hashBuffer = await crypto.subtle.digest('SHA-256', data);
     const hashArray = Array.from(new Uint8Array(hashBuffer));
     const hashHex = hashArray.map(b => b.toString(16).padStart(2, '0')).join('');
@@ -463,6 +499,15 @@ async function checkSolution() {
         return;
     }
 
+    // A hash saved in an older format can't be compared; retry fetching a fresh one
+    if (currentPuzzle.hashVersion !== HASH_VERSION) {
+        await refreshSolutionHash();
+        if (currentPuzzle.hashVersion !== HASH_VERSION) {
+            showMessage('could not verify solution. please try again.', 'error');
+            return;
+        }
+    }
+
     try {
         // Hash the current user grid
         const userGridHash = await hashGrid(currentPuzzle.userGrid);